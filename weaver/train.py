@@ -711,6 +711,10 @@ def _main(args):
         except AttributeError:
             pass
 
+    if gpus is not None:
+        from weaver.utils.nn.tools import configure_cudnn
+        configure_cudnn()
+
     # load data
     if training_mode:
         train_loader, val_loader, data_config, train_input_names, train_label_names = train_load(args)
@@ -798,7 +802,8 @@ def _main(args):
 
             _logger.info('Epoch #%d validating' % epoch)
             valid_metric = evaluate(model, val_loader, dev, epoch, loss_func=loss_func,
-                                    steps_per_epoch=args.steps_per_epoch_val, tb_helper=tb)
+                                    steps_per_epoch=args.steps_per_epoch_val, tb_helper=tb,
+                                    amp_dtype=torch.float16 if (args.use_amp and gpus is not None) else None)
             is_best_epoch = (
                 valid_metric < best_valid_metric) if args.regression_mode else(
                 valid_metric > best_valid_metric)
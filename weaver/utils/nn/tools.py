@@ -1,3 +1,7 @@
+import os
+import gc
+import contextlib
+import functools
 import numpy as np
 import awkward as ak
 import tqdm
@@ -9,6 +13,67 @@ from .metrics import evaluate_metrics
 from ..data.tools import _concat
 from ..logger import _logger
 
+# opt the CUDA caching allocator into expandable segments so that variable-length
+# batches do not trigger repeated cudaMalloc/cudaFree segment churn, and cap the
+# block size the allocator will split so large blocks are not fragmented mid-epoch;
+# unrecognized keys are a hard error at the first CUDA allocation, so probe each
+# candidate through the allocator's own parser and keep the first one this torch
+# build accepts (CUDA is not initialized yet at import time, so setting the
+# variable after `import torch` still takes effect)
+if 'PYTORCH_CUDA_ALLOC_CONF' not in os.environ:
+    for _alloc_conf in ('expandable_segments:True,max_split_size_mb:512', 'max_split_size_mb:512'):
+        try:
+            torch.cuda.memory._set_allocator_settings(_alloc_conf)
+        except (AttributeError, RuntimeError):
+            continue
+        os.environ['PYTORCH_CUDA_ALLOC_CONF'] = _alloc_conf
+        break
+
+# collect garbage every `GC_SCHEDULE` batches; automatic collection is disabled
+# inside the train/eval loops to keep it off the per-batch critical path
+GC_SCHEDULE = 50
+
+# sync device-side running stats back to the host (for the progress bar and the
+# per-batch tensorboard scalars) only every `LOG_EVERY` batches; every `.item()`
+# call in between would stall the pipeline with a cudaStreamSynchronize
+LOG_EVERY = 10
+
+# flush accumulated per-batch score tensors from the device to the host every
+# `SCORE_FLUSH_EVERY` batches: one packed D2H copy instead of a small
+# synchronous copy per batch
+SCORE_FLUSH_EVERY = 128
+
+
+def _with_scheduled_gc(fn):
+    # disable automatic garbage collection while a train/eval loop is running;
+    # the loops trigger a manual collection every `GC_SCHEDULE` batches instead
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        gc.disable()
+        gc.collect()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            gc.enable()
+    return wrapper
+
+
+def configure_cudnn(enable_benchmark=True, benchmark_limit=10, allow_tf32=True):
+    # one-shot cuDNN setup, to be called once at program startup rather than in the
+    # per-call hot path; `benchmark` autotuning helps for fixed input shapes but
+    # thrashes the kernel cache when shapes vary per batch, so callers feeding
+    # variable-length inputs should pass `enable_benchmark=False`
+    torch.backends.cudnn.enabled = True
+    torch.backends.cudnn.benchmark = enable_benchmark
+    if hasattr(torch.backends.cudnn, 'benchmark_limit'):
+        # cap the autotuning time spent on each new shape
+        torch.backends.cudnn.benchmark_limit = benchmark_limit
+    if allow_tf32 and hasattr(torch.backends.cuda, 'matmul'):
+        # let matmuls/convolutions use TF32 tensor cores on Ampere+; ~10 bits of
+        # mantissa is plenty for these losses and metrics
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+
 
 def _flatten_label(label, mask=None):
     if label.ndim > 1:
@@ -30,73 +95,236 @@ def _flatten_preds(preds, mask=None, label_axis=1):
     return preds
 
 
+def _num_classes(data_config):
+    # the classification class count, when knowable from the config: in 'simple'
+    # label mode the label is an argmax over the len(label_value) class branches;
+    # custom label expressions leave it unknown (0)
+    label_value = getattr(data_config, 'label_value', None)
+    if isinstance(label_value, (list, tuple)):
+        return len(label_value)
+    return 0
+
+
+class _LabelHist(object):
+    # device-side class-count histogram; when the class count is known from the
+    # config the per-batch update is a single index_add_, which launches
+    # asynchronously, whereas torch.bincount sizes its output from
+    # label.max().item() and would stall the stream once per batch
+
+    def __init__(self, dev, num_classes=0):
+        self._fixed = num_classes > 0
+        self._hist = torch.zeros(num_classes, dtype=torch.long, device=dev) if self._fixed else None
+
+    def update(self, label):
+        if self._fixed:
+            self._hist.index_add_(0, label, torch.ones_like(label))
+            return
+        # class count unknown up front: fall back to a growable bincount
+        counts = torch.bincount(label)
+        if self._hist is None:
+            self._hist = counts
+        elif counts.numel() > self._hist.numel():
+            counts[:self._hist.numel()] += self._hist
+            self._hist = counts
+        else:
+            self._hist[:counts.numel()] += counts
+
+    def to_counter(self):
+        # one D2H transfer at epoch end, in the Counter format used for logging
+        if self._hist is None:
+            return Counter()
+        return Counter({i: n for i, n in enumerate(self._hist.cpu().tolist()) if n > 0})
+
+
+def _prefetch_inputs(iterator, dev, input_names):
+    # yield `(inputs, y, Z)` triples with the input tensors already moved to `dev`;
+    # on CUDA devices the H2D copies for the next batch are issued on a dedicated
+    # copy stream while the current batch is being consumed, overlapping the
+    # transfers with compute; tensors that do not come out of the DataLoader
+    # pinned are staged through pinned memory so the copies can run asynchronously
+    if not isinstance(dev, torch.device):
+        dev = torch.device(dev)
+    if dev.type != 'cuda':
+        for X, y, Z in iterator:
+            yield [X[k].to(dev) for k in input_names], y, Z
+        return
+
+    copy_stream = torch.cuda.Stream(dev)
+    # two pinned staging buffers used alternately (the prefetcher runs one batch
+    # ahead): a slot is only rewritten after its previous H2D copy has completed
+    staging = [None, None]
+    staging_done = [None, None]
+    slot = 0
+
+    def _pack(tensors):
+        # pack all input groups into one pinned staging buffer so a single H2D
+        # copy (instead of one per input group) moves the whole batch, then hand
+        # out zero-copy views of the flat device tensor
+        nonlocal slot
+        numels = [t.numel() for t in tensors]
+        total = sum(numels)
+        buf = staging[slot]
+        if buf is None or buf.numel() < total or buf.dtype != tensors[0].dtype:
+            staging[slot] = buf = torch.empty(total, dtype=tensors[0].dtype, pin_memory=True)
+        elif staging_done[slot] is not None:
+            # the slot was last filled two batches ago; wait out that copy
+            staging_done[slot].synchronize()
+        flat = buf[:total]
+        torch.cat([t.reshape(-1) for t in tensors], out=flat)
+        with torch.cuda.stream(copy_stream):
+            big = flat.to(dev, non_blocking=True)
+        done = torch.cuda.Event()
+        done.record(copy_stream)
+        staging_done[slot] = done
+        slot = 1 - slot
+        inputs = []
+        offset = 0
+        for t, n in zip(tensors, numels):
+            inputs.append(big[offset:offset + n].view(t.shape))
+            offset += n
+        return inputs, done
+
+    def _issue(batch):
+        X, y, Z = batch
+        tensors = [X[k] for k in input_names]
+        if len(tensors) > 1 and all(t.dtype == tensors[0].dtype for t in tensors):
+            inputs, done = _pack(tensors)
+            return inputs, None, y, Z, done
+        # single input group (or mixed dtypes): copy each tensor on its own
+        pinned = [t if t.is_pinned() else t.pin_memory() for t in tensors]
+        with torch.cuda.stream(copy_stream):
+            inputs = [t.to(dev, non_blocking=True) for t in pinned]
+        done = torch.cuda.Event()
+        done.record(copy_stream)
+        # keep the pinned host tensors alive until the copies have completed
+        return inputs, pinned, y, Z, done
+
+    def _consume(entry):
+        inputs, _, y, Z, done = entry
+        current = torch.cuda.current_stream(dev)
+        current.wait_event(done)
+        for t in inputs:
+            t.record_stream(current)
+        return inputs, y, Z
+
+    prev = None
+    for batch in iterator:
+        entry = _issue(batch)
+        if prev is not None:
+            yield _consume(prev)
+        prev = entry
+    if prev is not None:
+        yield _consume(prev)
+
+
+def _train_step(model, inputs, label, loss_func, opt, grad_scaler, label_mask=None, squeeze_output=False):
+    # shared forward/backward/optimizer-step body of the train loops, kept as a
+    # single function so it can be captured by torch.compile as one graph;
+    # set_to_none frees the gradient storage instead of filling it with zeros,
+    # saving a full pass over the parameters and their memory between steps
+    opt.zero_grad(set_to_none=True)
+    with torch.cuda.amp.autocast(enabled=grad_scaler is not None):
+        model_output = model(*inputs)
+        if squeeze_output:
+            preds = model_output.squeeze()
+        else:
+            preds = _flatten_preds(model_output, label_mask)
+        loss = loss_func(preds, label)
+    if grad_scaler is None:
+        loss.backward()
+        opt.step()
+    else:
+        grad_scaler.scale(loss).backward()
+        grad_scaler.step(opt)
+        grad_scaler.update()
+    return model_output, preds, loss
+
+
+# opt-in graph capture of the train step; jet batches have data-dependent shapes,
+# so trace with dynamic shapes rather than relying on CUDA-graph replay
+if hasattr(torch, 'compile') and os.environ.get('WEAVER_COMPILE_TRAIN_STEP', '') not in ('', '0', 'false', 'False'):
+    _train_step = torch.compile(_train_step, dynamic=True)
+
+
+@_with_scheduled_gc
 def train_classification(model, loss_func, opt, scheduler, train_loader, dev, epoch, steps_per_epoch=None, grad_scaler=None, tb_helper=None):
     model.train()
 
     data_config = train_loader.dataset.config
-
-    label_counter = Counter()
-    total_loss = 0
+    # bind the config attributes to locals once; inside the batch loop every
+    # attribute lookup and string concatenation would repeat per iteration
+    input_names = data_config.input_names
+    label_name = data_config.label_names[0]
+    mask_name = label_name + '_mask'
+
+    label_hist = _LabelHist(dev, _num_classes(data_config))
+    total_loss = torch.zeros((), device=dev)
     num_batches = 0
-    total_correct = 0
+    total_correct = torch.zeros((), dtype=torch.long, device=dev)
     count = 0
+    scalar_buf = _ScalarBuffer(tb_helper)
+    # bind the hook once; the per-batch check is then a plain None test
+    tb_custom_fn = tb_helper.custom_fn if tb_helper else None
     start_time = time.time()
     with tqdm.tqdm(train_loader) as tq:
-        for X, y, _ in tq:
-            inputs = [X[k].to(dev) for k in data_config.input_names]
-            label = y[data_config.label_names[0]].long()
+        for inputs, y, _ in _prefetch_inputs(tq, dev, input_names):
             try:
-                label_mask = y[data_config.label_names[0] + '_mask'].bool()
+                label_mask = y[mask_name].bool()
             except KeyError:
                 label_mask = None
-            label = _flatten_label(label, label_mask)
+            # copy the loader tensor (pinned) to the device before casting:
+            # casting first would allocate pageable memory and force the H2D
+            # copy to be synchronous
+            label = _flatten_label(y[label_name], label_mask)
             num_examples = label.shape[0]
-            label_counter.update(label.cpu().numpy())
-            label = label.to(dev)
-            opt.zero_grad()
-            with torch.cuda.amp.autocast(enabled=grad_scaler is not None):
-                model_output = model(*inputs)
-                logits = _flatten_preds(model_output, label_mask)
-                loss = loss_func(logits, label)
-            if grad_scaler is None:
-                loss.backward()
-                opt.step()
-            else:
-                grad_scaler.scale(loss).backward()
-                grad_scaler.step(opt)
-                grad_scaler.update()
+            label = label.to(dev, non_blocking=True).long()
+            label_hist.update(label)
+            model_output, logits, loss = _train_step(
+                model, inputs, label, loss_func, opt, grad_scaler, label_mask=label_mask)
 
             if scheduler and getattr(scheduler, '_update_per_step', False):
                 scheduler.step()
 
-            _, preds = logits.max(1)
-            loss = loss.item()
+            preds = logits.argmax(1)
 
             num_batches += 1
             count += num_examples
-            correct = (preds == label).sum().item()
-            total_loss += loss
+            correct = (preds == label).sum()
+            total_loss += loss.detach()
             total_correct += correct
 
-            tq.set_postfix({
-                'lr': '%.2e' % scheduler.get_last_lr()[0] if scheduler else opt.defaults['lr'],
-                'Loss': '%.5f' % loss,
-                'AvgLoss': '%.5f' % (total_loss / num_batches),
-                'Acc': '%.5f' % (correct / num_examples),
-                'AvgAcc': '%.5f' % (total_correct / count)})
-
-            if tb_helper:
-                tb_helper.write_scalars([
-                    ("Loss/train", loss, tb_helper.batch_train_count + num_batches),
-                    ("Acc/train", correct / num_examples, tb_helper.batch_train_count + num_batches),
-                    ])
-                if tb_helper.custom_fn:
-                    with torch.no_grad():
-                        tb_helper.custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=num_batches, mode='train')
+            if num_batches % LOG_EVERY == 0:
+                # sync the running stats back to the host only at logging cadence
+                loss_val = loss.item()
+                correct_val = correct.item()
+                tq.set_postfix({
+                    'lr': '%.2e' % scheduler.get_last_lr()[0] if scheduler else opt.defaults['lr'],
+                    'Loss': '%.5f' % loss_val,
+                    'AvgLoss': '%.5f' % (total_loss.item() / num_batches),
+                    'Acc': '%.5f' % (correct_val / num_examples),
+                    'AvgAcc': '%.5f' % (total_correct.item() / count)})
+
+                if tb_helper:
+                    scalar_buf.add([
+                        ("Loss/train", loss_val, tb_helper.batch_train_count + num_batches),
+                        ("Acc/train", correct_val / num_examples, tb_helper.batch_train_count + num_batches),
+                        ])
+
+            if tb_custom_fn is not None:
+                with torch.no_grad():
+                    tb_custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=num_batches, mode='train')
+
+            if num_batches % GC_SCHEDULE == 0:
+                gc.collect()
 
             if steps_per_epoch is not None and num_batches >= steps_per_epoch:
                 break
 
+    total_loss = total_loss.item()
+    total_correct = total_correct.item()
+    label_counter = label_hist.to_counter()
+    scalar_buf.flush()
+
     time_diff = time.time() - start_time
     _logger.info('Processed %d entries in total (avg. speed %.1f entries/s)' % (count, count / time_diff))
     _logger.info('Train AvgLoss: %.5f, AvgAcc: %.5f' % (total_loss / num_batches, total_correct / count))
@@ -112,85 +340,135 @@ def train_classification(model, loss_func, opt, scheduler, train_loader, dev, ep
                 tb_helper.custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=-1, mode='train')
         # update the batch state
         tb_helper.batch_train_count += num_batches
+        tb_helper.flush()
 
     if scheduler and not getattr(scheduler, '_update_per_step', False):
         scheduler.step()
 
 
+@_with_scheduled_gc
 def evaluate_classification(model, test_loader, dev, epoch, for_training=True, loss_func=None, steps_per_epoch=None,
                             eval_metrics=['roc_auc_score', 'roc_auc_score_matrix', 'confusion_matrix'],
-                            tb_helper=None):
+                            tb_helper=None, release_cache=False, amp_dtype=None):
     model.eval()
 
     data_config = test_loader.dataset.config
-
-    label_counter = Counter()
-    total_loss = 0
+    # bind the config attributes to locals once; inside the batch loop every
+    # attribute lookup and string concatenation would repeat per iteration
+    input_names = data_config.input_names
+    label_name = data_config.label_names[0]
+    mask_name = label_name + '_mask'
+
+    label_hist = _LabelHist(dev, _num_classes(data_config))
+    total_loss = torch.zeros((), device=dev)
     num_batches = 0
-    total_correct = 0
+    total_correct = torch.zeros((), dtype=torch.long, device=dev)
     entry_count = 0
     count = 0
     scores = []
+    scores_buf = []
+
+    def _flush_scores():
+        # softmax over the whole buffered chunk at once (in float32), instead
+        # of one small softmax kernel per batch
+        if scores_buf:
+            scores.append(torch.softmax(torch.cat(scores_buf).float(), dim=1).cpu().numpy())
+            scores_buf.clear()
+
     labels = defaultdict(list)
     labels_counts = []
     observers = defaultdict(list)
+    # bind the hook and mode string once; the per-batch check is a plain None test
+    tb_custom_fn = tb_helper.custom_fn if tb_helper else None
+    tb_mode = 'eval' if for_training else 'test'
+    # build the autocast context only when requested: torch.autocast raises
+    # for device types it does not recognize even with enabled=False
+    if amp_dtype is not None:
+        amp_ctx = torch.autocast(torch.device(dev).type, dtype=amp_dtype)
+    else:
+        amp_ctx = contextlib.nullcontext()
     start_time = time.time()
-    with torch.no_grad():
+    # inference_mode goes further than no_grad: it also skips the version-counter
+    # bookkeeping on every tensor produced in the loop
+    with torch.inference_mode():
         with tqdm.tqdm(test_loader) as tq:
-            for X, y, Z in tq:
-                inputs = [X[k].to(dev) for k in data_config.input_names]
-                label = y[data_config.label_names[0]].long()
-                entry_count += label.shape[0]
+            for inputs, y, Z in _prefetch_inputs(tq, dev, input_names):
+                entry_count += y[label_name].shape[0]
                 try:
-                    label_mask = y[data_config.label_names[0] + '_mask'].bool()
+                    label_mask = y[mask_name].bool()
                 except KeyError:
                     label_mask = None
                 if not for_training and label_mask is not None:
                     labels_counts.append(np.squeeze(label_mask.numpy().sum(axis=-1)))
-                label = _flatten_label(label, label_mask)
-                num_examples = label.shape[0]
-                label_counter.update(label.cpu().numpy())
-                label = label.to(dev)
-                model_output = model(*inputs)
-                logits = _flatten_preds(model_output, label_mask).float()
-
-                scores.append(torch.softmax(logits, dim=1).detach().cpu().numpy())
-                for k, v in y.items():
-                    labels[k].append(_flatten_label(v, label_mask).cpu().numpy())
+                # copy the loader tensor (pinned) to the device before casting:
+                # casting first would allocate pageable memory and force the H2D
+                # copy to be synchronous
+                label_cpu = _flatten_label(y[label_name], label_mask)
+                num_examples = label_cpu.shape[0]
+                label = label_cpu.to(dev, non_blocking=True).long()
+                label_hist.update(label)
+                # autocast only the forward pass; loss and softmax below run in
+                # float32 for numerical stability
+                with amp_ctx:
+                    model_output = model(*inputs)
+                logits = _flatten_preds(model_output, label_mask)
+                if amp_dtype is not None:
+                    logits = logits.float()
+
+                # buffer the raw logits; the softmax happens per flushed chunk
+                scores_buf.append(logits)
+                if len(scores_buf) >= SCORE_FLUSH_EVERY:
+                    _flush_scores()
+                # the primary label was already flattened above; don't flatten it twice
+                labels[label_name].append(label_cpu.numpy())
                 if not for_training:
+                    # the extra label branches and observers are only part of
+                    # the test-mode return value
+                    for k, v in y.items():
+                        if k == label_name:
+                            continue
+                        labels[k].append(_flatten_label(v, label_mask).cpu().numpy())
                     for k, v in Z.items():
                         observers[k].append(v.cpu().numpy())
 
-                _, preds = logits.max(1)
-                loss = 0 if loss_func is None else loss_func(logits, label).item()
+                preds = logits.argmax(1)
+                loss = None if loss_func is None else loss_func(logits, label)
 
                 num_batches += 1
                 count += num_examples
-                correct = (preds == label).sum().item()
-                total_loss += loss * num_examples
+                correct = (preds == label).sum()
+                if loss is not None:
+                    total_loss += loss * num_examples
                 total_correct += correct
 
-                tq.set_postfix({
-                    'Loss': '%.5f' % loss,
-                    'AvgLoss': '%.5f' % (total_loss / count),
-                    'Acc': '%.5f' % (correct / num_examples),
-                    'AvgAcc': '%.5f' % (total_correct / count)})
+                if num_batches % LOG_EVERY == 0:
+                    # sync the running stats back to the host only at logging cadence
+                    loss_val = 0 if loss is None else loss.item()
+                    tq.set_postfix({
+                        'Loss': '%.5f' % loss_val,
+                        'AvgLoss': '%.5f' % (total_loss.item() / count),
+                        'Acc': '%.5f' % (correct.item() / num_examples),
+                        'AvgAcc': '%.5f' % (total_correct.item() / count)})
 
-                if tb_helper:
-                    if tb_helper.custom_fn:
-                        with torch.no_grad():
-                            tb_helper.custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=num_batches,
-                                                mode='eval' if for_training else 'test')
+                if tb_custom_fn is not None:
+                    tb_custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=num_batches, mode=tb_mode)
+
+                if num_batches % GC_SCHEDULE == 0:
+                    gc.collect()
 
                 if steps_per_epoch is not None and num_batches >= steps_per_epoch:
                     break
 
+    _flush_scores()
+    total_loss = total_loss.item()
+    total_correct = total_correct.item()
+    label_counter = label_hist.to_counter()
+
     time_diff = time.time() - start_time
     _logger.info('Processed %d entries in total (avg. speed %.1f entries/s)' % (count, count / time_diff))
     _logger.info('Evaluation class distribution: \n    %s', str(sorted(label_counter.items())))
 
     if tb_helper:
-        tb_mode = 'eval' if for_training else 'test'
         tb_helper.write_scalars([
             ("Loss/%s (epoch)" % tb_mode, total_loss / count, epoch),
             ("Acc/%s (epoch)" % tb_mode, total_correct / count, epoch),
@@ -198,10 +476,15 @@ def evaluate_classification(model, test_loader, dev, epoch, for_training=True, l
         if tb_helper.custom_fn:
             with torch.no_grad():
                 tb_helper.custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=-1, mode=tb_mode)
+        tb_helper.flush()
+
+    # release cached allocator blocks only once per call, never inside the loop
+    if release_cache and torch.cuda.is_available():
+        torch.cuda.empty_cache()
 
     scores = np.concatenate(scores)
     labels = {k: _concat(v) for k, v in labels.items()}
-    metric_results = evaluate_metrics(labels[data_config.label_names[0]], scores, eval_metrics=eval_metrics)
+    metric_results = evaluate_metrics(labels[label_name], scores, eval_metrics=eval_metrics)
     _logger.info('Evaluation metrics: \n%s', '\n'.join(
         ['    - %s: \n%s' % (k, str(v)) for k, v in metric_results.items()]))
 
@@ -224,14 +507,62 @@ def evaluate_classification(model, test_loader, dev, epoch, for_training=True, l
         return total_correct / count, scores, labels, observers
 
 
+@torch.jit.script
+def _l1_l2sq(e: torch.Tensor) -> torch.Tensor:
+    # fused [sum(|e|), sum(e^2)] residual reduction; scripting lets the fuser
+    # emit a single kernel instead of four elementwise/reduction launches
+    return torch.stack([e.abs().sum(), e.square().sum()])
+
+
+@functools.lru_cache(maxsize=None)
+def _onnx_correct_count_kernel():
+    # optional numba kernel fusing the per-batch argmax over classes and the
+    # correct-prediction count into one parallel pass over the (N, K) score
+    # array; returns None when numba is not installed and the numpy fallback
+    # (argmax + compare + sum, three passes) is used instead
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _count(score, label):
+        correct = 0
+        for i in numba.prange(score.shape[0]):
+            best = 0
+            for j in range(1, score.shape[1]):
+                if score[i, j] > score[i, best]:
+                    best = j
+            if best == label[i]:
+                correct += 1
+        return correct
+
+    return _count
+
+
+@_with_scheduled_gc
 def evaluate_onnx(model_path, test_loader, eval_metrics=['roc_auc_score', 'roc_auc_score_matrix', 'confusion_matrix']):
     import onnxruntime
-    sess = onnxruntime.InferenceSession(model_path)
+    so = onnxruntime.SessionOptions()
+    so.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # thread counts are env-overridable for deployment-specific tuning
+    so.intra_op_num_threads = int(os.environ.get('ORT_INTRA_OP_NUM_THREADS', os.cpu_count() or 1))
+    so.inter_op_num_threads = int(os.environ.get('ORT_INTER_OP_NUM_THREADS', 1))
+    sess = onnxruntime.InferenceSession(model_path, sess_options=so,
+                                        providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+    # reuse a single io_binding across batches: the input tensors' storage is
+    # bound zero-copy instead of rebuilding a numpy feed dict every batch
+    io_binding = sess.io_binding()
+    onnx_input_names = [inp.name for inp in sess.get_inputs()]
+    onnx_output_name = sess.get_outputs()[0].name
 
     data_config = test_loader.dataset.config
+    label_name = data_config.label_names[0]
+    correct_count = _onnx_correct_count_kernel()
 
-    label_counter = Counter()
+    label_hist = None
     total_correct = 0
+    num_batches = 0
     count = 0
     scores = []
     labels = defaultdict(list)
@@ -239,12 +570,24 @@ def evaluate_onnx(model_path, test_loader, eval_metrics=['roc_auc_score', 'roc_a
     start_time = time.time()
     with tqdm.tqdm(test_loader) as tq:
         for X, y, Z in tq:
-            inputs = {k: v.cpu().numpy() for k, v in X.items()}
-            label = y[data_config.label_names[0]].cpu().numpy()
+            for k in onnx_input_names:
+                io_binding.bind_cpu_input(k, X[k].contiguous().numpy())
+            io_binding.bind_output(onnx_output_name)
+            label = y[label_name].cpu().numpy()
             num_examples = label.shape[0]
-            label_counter.update(label)
-            score = sess.run([], inputs)[0]
-            preds = score.argmax(1)
+            # histogram the labels instead of feeding every sample through a
+            # Counter; custom label configs can yield float branches, which
+            # np.bincount rejects, so cast to integer first
+            counts = np.bincount(label.astype(np.int64, copy=False))
+            if label_hist is None:
+                label_hist = counts
+            elif counts.size > label_hist.size:
+                counts[:label_hist.size] += label_hist
+                label_hist = counts
+            else:
+                label_hist[:counts.size] += counts
+            sess.run_with_iobinding(io_binding)
+            score = io_binding.copy_outputs_to_cpu()[0]
 
             scores.append(score)
             for k, v in y.items():
@@ -252,13 +595,24 @@ def evaluate_onnx(model_path, test_loader, eval_metrics=['roc_auc_score', 'roc_a
             for k, v in Z.items():
                 observers[k].append(v.cpu().numpy())
 
-            correct = (preds == label).sum()
+            if correct_count is not None:
+                correct = correct_count(score, label)
+            else:
+                correct = (score.argmax(1) == label).sum()
             total_correct += correct
+            num_batches += 1
             count += num_examples
 
-            tq.set_postfix({
-                'Acc': '%.5f' % (correct / num_examples),
-                'AvgAcc': '%.5f' % (total_correct / count)})
+            if num_batches % LOG_EVERY == 0:
+                tq.set_postfix({
+                    'Acc': '%.5f' % (correct / num_examples),
+                    'AvgAcc': '%.5f' % (total_correct / count)})
+
+            if num_batches % GC_SCHEDULE == 0:
+                gc.collect()
+
+    label_counter = Counter() if label_hist is None else Counter(
+        {i: int(n) for i, n in enumerate(label_hist) if n > 0})
 
     time_diff = time.time() - start_time
     _logger.info('Processed %d entries in total (avg. speed %.1f entries/s)' % (count, count / time_diff))
@@ -266,80 +620,83 @@ def evaluate_onnx(model_path, test_loader, eval_metrics=['roc_auc_score', 'roc_a
 
     scores = np.concatenate(scores)
     labels = {k: _concat(v) for k, v in labels.items()}
-    metric_results = evaluate_metrics(labels[data_config.label_names[0]], scores, eval_metrics=eval_metrics)
+    metric_results = evaluate_metrics(labels[label_name], scores, eval_metrics=eval_metrics)
     _logger.info('Evaluation metrics: \n%s', '\n'.join(
         ['    - %s: \n%s' % (k, str(v)) for k, v in metric_results.items()]))
     observers = {k: _concat(v) for k, v in observers.items()}
     return total_correct / count, scores, labels, observers
 
 
+@_with_scheduled_gc
 def train_regression(model, loss_func, opt, scheduler, train_loader, dev, epoch, steps_per_epoch=None, grad_scaler=None, tb_helper=None):
     model.train()
 
     data_config = train_loader.dataset.config
+    input_names = data_config.input_names
+    label_name = data_config.label_names[0]
 
-    total_loss = 0
+    total_loss = torch.zeros((), device=dev)
     num_batches = 0
-    sum_abs_err = 0
-    sum_sqr_err = 0
+    # fused running [sum(|e|), sum(e^2)] accumulator
+    sum_err = torch.zeros(2, device=dev)
     count = 0
+    scalar_buf = _ScalarBuffer(tb_helper)
+    # bind the hook once; the per-batch check is then a plain None test
+    tb_custom_fn = tb_helper.custom_fn if tb_helper else None
     start_time = time.time()
     with tqdm.tqdm(train_loader) as tq:
-        for X, y, _ in tq:
-            inputs = [X[k].to(dev) for k in data_config.input_names]
-            label = y[data_config.label_names[0]].float()
-            num_examples = label.shape[0]
-            label = label.to(dev)
-            opt.zero_grad()
-            with torch.cuda.amp.autocast(enabled=grad_scaler is not None):
-                model_output = model(*inputs)
-                preds = model_output.squeeze()
-                loss = loss_func(preds, label)
-            if grad_scaler is None:
-                loss.backward()
-                opt.step()
-            else:
-                grad_scaler.scale(loss).backward()
-                grad_scaler.step(opt)
-                grad_scaler.update()
+        for inputs, y, _ in _prefetch_inputs(tq, dev, input_names):
+            num_examples = y[label_name].shape[0]
+            # copy the pinned loader tensor, cast on device (see train_classification)
+            label = y[label_name].to(dev, non_blocking=True).float()
+            model_output, preds, loss = _train_step(
+                model, inputs, label, loss_func, opt, grad_scaler, squeeze_output=True)
 
             if scheduler and getattr(scheduler, '_update_per_step', False):
                 scheduler.step()
 
-            loss = loss.item()
-
             num_batches += 1
             count += num_examples
-            total_loss += loss
-            e = preds - label
-            abs_err = e.abs().sum().item()
-            sum_abs_err += abs_err
-            sqr_err = e.square().sum().item()
-            sum_sqr_err += sqr_err
-
-            tq.set_postfix({
-                'lr': '%.2e' % scheduler.get_last_lr()[0] if scheduler else opt.defaults['lr'],
-                'Loss': '%.5f' % loss,
-                'AvgLoss': '%.5f' % (total_loss / num_batches),
-                'MSE': '%.5f' % (sqr_err / num_examples),
-                'AvgMSE': '%.5f' % (sum_sqr_err / count),
-                'MAE': '%.5f' % (abs_err / num_examples),
-                'AvgMAE': '%.5f' % (sum_abs_err / count),
-            })
-
-            if tb_helper:
-                tb_helper.write_scalars([
-                    ("Loss/train", loss, tb_helper.batch_train_count + num_batches),
-                    ("MSE/train", sqr_err / num_examples, tb_helper.batch_train_count + num_batches),
-                    ("MAE/train", abs_err / num_examples, tb_helper.batch_train_count + num_batches),
-                    ])
-                if tb_helper.custom_fn:
-                    with torch.no_grad():
-                        tb_helper.custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=num_batches, mode='train')
+            total_loss += loss.detach()
+            err = _l1_l2sq((preds - label).detach())
+            sum_err += err
+
+            if num_batches % LOG_EVERY == 0:
+                # sync the running stats back to the host only at logging cadence
+                loss_val = loss.item()
+                abs_err_val, sqr_err_val = err.tolist()
+                sum_abs_err_val, sum_sqr_err_val = sum_err.tolist()
+                tq.set_postfix({
+                    'lr': '%.2e' % scheduler.get_last_lr()[0] if scheduler else opt.defaults['lr'],
+                    'Loss': '%.5f' % loss_val,
+                    'AvgLoss': '%.5f' % (total_loss.item() / num_batches),
+                    'MSE': '%.5f' % (sqr_err_val / num_examples),
+                    'AvgMSE': '%.5f' % (sum_sqr_err_val / count),
+                    'MAE': '%.5f' % (abs_err_val / num_examples),
+                    'AvgMAE': '%.5f' % (sum_abs_err_val / count),
+                })
+
+                if tb_helper:
+                    scalar_buf.add([
+                        ("Loss/train", loss_val, tb_helper.batch_train_count + num_batches),
+                        ("MSE/train", sqr_err_val / num_examples, tb_helper.batch_train_count + num_batches),
+                        ("MAE/train", abs_err_val / num_examples, tb_helper.batch_train_count + num_batches),
+                        ])
+
+            if tb_custom_fn is not None:
+                with torch.no_grad():
+                    tb_custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=num_batches, mode='train')
+
+            if num_batches % GC_SCHEDULE == 0:
+                gc.collect()
 
             if steps_per_epoch is not None and num_batches >= steps_per_epoch:
                 break
 
+    total_loss = total_loss.item()
+    sum_abs_err, sum_sqr_err = sum_err.tolist()
+    scalar_buf.flush()
+
     time_diff = time.time() - start_time
     _logger.info('Processed %d entries in total (avg. speed %.1f entries/s)' % (count, count / time_diff))
     _logger.info('Train AvgLoss: %.5f, AvgMSE: %.5f, AvgMAE: %.5f' %
@@ -356,79 +713,105 @@ def train_regression(model, loss_func, opt, scheduler, train_loader, dev, epoch,
                 tb_helper.custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=-1, mode='train')
         # update the batch state
         tb_helper.batch_train_count += num_batches
+        tb_helper.flush()
 
     if scheduler and not getattr(scheduler, '_update_per_step', False):
         scheduler.step()
 
 
+@_with_scheduled_gc
 def evaluate_regression(model, test_loader, dev, epoch, for_training=True, loss_func=None, steps_per_epoch=None,
                         eval_metrics=['mean_squared_error', 'mean_absolute_error', 'median_absolute_error',
                                       'mean_gamma_deviance'],
-                        tb_helper=None):
+                        tb_helper=None, release_cache=False, amp_dtype=None):
     model.eval()
 
     data_config = test_loader.dataset.config
+    input_names = data_config.input_names
+    label_name = data_config.label_names[0]
 
-    total_loss = 0
+    total_loss = torch.zeros((), device=dev)
     num_batches = 0
-    sum_sqr_err = 0
-    sum_abs_err = 0
+    # fused running [sum(|e|), sum(e^2)] accumulator
+    sum_err = torch.zeros(2, device=dev)
     count = 0
     scores = []
     labels = defaultdict(list)
     observers = defaultdict(list)
+    # bind the hook and mode string once; the per-batch check is a plain None test
+    tb_custom_fn = tb_helper.custom_fn if tb_helper else None
+    tb_mode = 'eval' if for_training else 'test'
+    # build the autocast context only when requested: torch.autocast raises
+    # for device types it does not recognize even with enabled=False
+    if amp_dtype is not None:
+        amp_ctx = torch.autocast(torch.device(dev).type, dtype=amp_dtype)
+    else:
+        amp_ctx = contextlib.nullcontext()
     start_time = time.time()
-    with torch.no_grad():
+    # inference_mode goes further than no_grad: it also skips the version-counter
+    # bookkeeping on every tensor produced in the loop
+    with torch.inference_mode():
         with tqdm.tqdm(test_loader) as tq:
-            for X, y, Z in tq:
-                inputs = [X[k].to(dev) for k in data_config.input_names]
-                label = y[data_config.label_names[0]].float()
-                num_examples = label.shape[0]
-                label = label.to(dev)
-                model_output = model(*inputs)
+            for inputs, y, Z in _prefetch_inputs(tq, dev, input_names):
+                num_examples = y[label_name].shape[0]
+                # copy the pinned loader tensor, cast on device (see train_classification)
+                label = y[label_name].to(dev, non_blocking=True).float()
+                # autocast only the forward pass; the residuals below run in float32
+                with amp_ctx:
+                    model_output = model(*inputs)
                 preds = model_output.squeeze().float()
 
-                scores.append(preds.detach().cpu().numpy())
-                for k, v in y.items():
-                    labels[k].append(v.cpu().numpy())
+                scores.append(preds.cpu().numpy())
+                labels[label_name].append(y[label_name].numpy())
                 if not for_training:
+                    # the extra label branches and observers are only part of
+                    # the test-mode return value
+                    for k, v in y.items():
+                        if k == label_name:
+                            continue
+                        labels[k].append(v.cpu().numpy())
                     for k, v in Z.items():
                         observers[k].append(v.cpu().numpy())
 
-                loss = 0 if loss_func is None else loss_func(preds, label).item()
+                loss = None if loss_func is None else loss_func(preds, label)
 
                 num_batches += 1
                 count += num_examples
-                total_loss += loss * num_examples
-                e = preds - label
-                abs_err = e.abs().sum().item()
-                sum_abs_err += abs_err
-                sqr_err = e.square().sum().item()
-                sum_sqr_err += sqr_err
-
-                tq.set_postfix({
-                    'Loss': '%.5f' % loss,
-                    'AvgLoss': '%.5f' % (total_loss / count),
-                    'MSE': '%.5f' % (sqr_err / num_examples),
-                    'AvgMSE': '%.5f' % (sum_sqr_err / count),
-                    'MAE': '%.5f' % (abs_err / num_examples),
-                    'AvgMAE': '%.5f' % (sum_abs_err / count),
-                })
-
-                if tb_helper:
-                    if tb_helper.custom_fn:
-                        with torch.no_grad():
-                            tb_helper.custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=num_batches,
-                                                mode='eval' if for_training else 'test')
+                if loss is not None:
+                    total_loss += loss * num_examples
+                err = _l1_l2sq(preds - label)
+                sum_err += err
+
+                if num_batches % LOG_EVERY == 0:
+                    # sync the running stats back to the host only at logging cadence
+                    loss_val = 0 if loss is None else loss.item()
+                    abs_err, sqr_err = err.tolist()
+                    sum_abs_err, sum_sqr_err = sum_err.tolist()
+                    tq.set_postfix({
+                        'Loss': '%.5f' % loss_val,
+                        'AvgLoss': '%.5f' % (total_loss.item() / count),
+                        'MSE': '%.5f' % (sqr_err / num_examples),
+                        'AvgMSE': '%.5f' % (sum_sqr_err / count),
+                        'MAE': '%.5f' % (abs_err / num_examples),
+                        'AvgMAE': '%.5f' % (sum_abs_err / count),
+                    })
+
+                if tb_custom_fn is not None:
+                    tb_custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=num_batches, mode=tb_mode)
+
+                if num_batches % GC_SCHEDULE == 0:
+                    gc.collect()
 
                 if steps_per_epoch is not None and num_batches >= steps_per_epoch:
                     break
 
+    total_loss = total_loss.item()
+    sum_abs_err, sum_sqr_err = sum_err.tolist()
+
     time_diff = time.time() - start_time
     _logger.info('Processed %d entries in total (avg. speed %.1f entries/s)' % (count, count / time_diff))
 
     if tb_helper:
-        tb_mode = 'eval' if for_training else 'test'
         tb_helper.write_scalars([
             ("Loss/%s (epoch)" % tb_mode, total_loss / count, epoch),
             ("MSE/%s (epoch)" % tb_mode, sum_sqr_err / count, epoch),
@@ -437,10 +820,15 @@ def evaluate_regression(model, test_loader, dev, epoch, for_training=True, loss_
         if tb_helper.custom_fn:
             with torch.no_grad():
                 tb_helper.custom_fn(model_output=model_output, model=model, epoch=epoch, i_batch=-1, mode=tb_mode)
+        tb_helper.flush()
+
+    # release cached allocator blocks only once per call, never inside the loop
+    if release_cache and torch.cuda.is_available():
+        torch.cuda.empty_cache()
 
     scores = np.concatenate(scores)
     labels = {k: _concat(v) for k, v in labels.items()}
-    metric_results = evaluate_metrics(labels[data_config.label_names[0]], scores, eval_metrics=eval_metrics)
+    metric_results = evaluate_metrics(labels[label_name], scores, eval_metrics=eval_metrics)
     _logger.info('Evaluation metrics: \n%s', '\n'.join(
         ['    - %s: \n%s' % (k, str(v)) for k, v in metric_results.items()]))
 
@@ -452,6 +840,28 @@ def evaluate_regression(model, test_loader, dev, epoch, for_training=True, loss_
         return total_loss / count, scores, labels, observers
 
 
+class _ScalarBuffer(object):
+    # buffers (tag, value, step) tuples and forwards them to the tensorboard
+    # helper in batches, amortizing the serialization/file I/O over many steps
+
+    def __init__(self, tb_helper, flush_every=50):
+        self._tb_helper = tb_helper
+        self._flush_every = flush_every
+        self._buffer = []
+
+    def add(self, write_info):
+        if self._tb_helper is None:
+            return
+        self._buffer.extend(write_info)
+        if len(self._buffer) >= self._flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._tb_helper.write_scalars(self._buffer)
+            self._buffer = []
+
+
 class TensorboardHelper(object):
 
     def __init__(self, tb_comment, tb_custom_fn):
@@ -462,6 +872,7 @@ class TensorboardHelper(object):
 
         # initiate the batch state
         self.batch_train_count = 0
+        self._new_style = True
 
         # load custom function
         self.custom_fn = tb_custom_fn
@@ -475,5 +886,18 @@ class TensorboardHelper(object):
         self.writer.close()
 
     def write_scalars(self, write_info):
+        # `new_style` serializes scalars via the (much cheaper) tensor proto;
+        # `add_scalars` is deliberately not used here since it spawns a separate
+        # event file per tag
         for tag, scalar_value, global_step in write_info:
+            if self._new_style:
+                try:
+                    self.writer.add_scalar(tag, scalar_value, global_step, new_style=True)
+                    continue
+                except TypeError:
+                    # older tensorboard without the new_style keyword
+                    self._new_style = False
             self.writer.add_scalar(tag, scalar_value, global_step)
+
+    def flush(self):
+        self.writer.flush()